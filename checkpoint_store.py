@@ -0,0 +1,238 @@
+# all checkpoints of a run in one append-only archive plus a json index
+#
+#   <run_dir>/checkpoints.bin  : concatenated records, each a compressed .npz of a state_dict
+#   <run_dir>/checkpoints.json : state_dim, action_dim and per episode offset / length / encoding / base / eval_reward
+#
+# records only hold numpy arrays, so loading does not depend on the source of the DQN class at save time
+import io
+import json
+import os
+import queue
+import threading
+import numpy as np
+
+ENCODINGS = ["float32", "float16", "delta"]
+
+
+class CheckpointStore:
+    def __init__(self, run_dir, encoding="float32", keep_last=None, keep_best=None, keyframe_every=10):
+        """
+            param:
+                run_dir: directory of the run, created if missing
+                encoding: "float32", "float16" or "delta" (float32 difference to the previous checkpoint)
+                keep_last: keep only the last keep_last checkpoints, None keeps all
+                keep_best: also keep the keep_best checkpoints with the highest eval reward
+                keyframe_every: with delta encoding, store a full checkpoint every keyframe_every saves so
+                    loading one checkpoint never reads more than keyframe_every records
+        """
+        if encoding not in ENCODINGS:
+            print("Invalid checkpoint encoding: {}".format(encoding))
+            raise ValueError
+        os.makedirs(run_dir, exist_ok=True)
+        self.archive_path = os.path.join(run_dir, "checkpoints.bin")
+        self.index_path = os.path.join(run_dir, "checkpoints.json")
+        self.encoding = encoding
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.keyframe_every = keyframe_every
+
+        self.index = {"state_dim": None, "action_dim": None, "checkpoints": {}, "garbage": 0}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as index_file:
+                self.index = json.load(index_file)
+        self.lock = threading.Lock()
+        self.last_episode = None
+        self.last_decoded = None
+        self.chain_length = 0
+
+        self.writes = queue.Queue()
+        self.writer = None
+        self.error = None
+
+    def episodes(self):
+        """
+            return:
+                sorted list of episodes with a stored checkpoint
+        """
+        with self.lock:
+            return sorted(int(episode) for episode in self.index["checkpoints"])
+
+    def save(self, episode, model, eval_reward=None):
+        """
+            snapshots the weights of model and writes them on a background thread
+            param:
+                episode: episode (or iteration) the checkpoint belongs to
+                model: DQN
+                eval_reward: latest evaluation reward, used by keep_best
+        """
+        self.raise_error()
+        arrays = {name: tensor.detach().cpu().numpy().copy() for name, tensor in model.state_dict().items()}
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+        self.writes.put((episode, arrays, eval_reward, model.state_dim, model.action_dim))
+
+    def close(self):
+        """
+            waits for all pending writes, raises the error of a failed write
+        """
+        if self.writer is not None:
+            self.writes.put(None)
+            self.writer.join()
+            self.writer = None
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write_loop(self):
+        while True:
+            item = self.writes.get()
+            if item is None:
+                return
+            # after a failed write keep draining the queue, the error is raised by the next save or close
+            if self.error is None:
+                try:
+                    self.write(*item)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, episode, arrays, eval_reward, state_dim, action_dim):
+        base = None
+        if self.encoding == "float16":
+            stored = {name: array.astype(np.float16) for name, array in arrays.items()}
+            decoded = None
+        elif self.encoding == "delta" and self.last_decoded is not None and self.chain_length < self.keyframe_every - 1:
+            base = self.last_episode
+            stored = {name: (array - self.last_decoded[name]).astype(np.float32) for name, array in arrays.items()}
+            decoded = {name: self.last_decoded[name] + stored[name] for name in stored}
+            self.chain_length += 1
+        else:
+            stored = {name: array.astype(np.float32) for name, array in arrays.items()}
+            decoded = stored
+            self.chain_length = 0
+        self.last_episode = episode
+        self.last_decoded = decoded
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **stored)
+        record = buffer.getvalue()
+
+        with self.lock:
+            with open(self.archive_path, "ab") as archive:
+                offset = archive.tell()
+                archive.write(record)
+            self.index["state_dim"] = int(state_dim)
+            self.index["action_dim"] = int(action_dim)
+            self.index["checkpoints"][str(episode)] = {
+                "offset": offset,
+                "length": len(record),
+                "encoding": "delta" if base is not None else ("float16" if self.encoding == "float16" else "float32"),
+                "base": base,
+                "eval_reward": None if eval_reward is None else float(eval_reward),
+            }
+            self.apply_retention(episode)
+            self.write_index()
+
+    def apply_retention(self, latest):
+        checkpoints = self.index["checkpoints"]
+        if self.keep_last is None and self.keep_best is None:
+            return
+        episodes = sorted(int(episode) for episode in checkpoints)
+        keep = {latest}
+        if self.keep_last is not None:
+            keep.update(episodes[-self.keep_last:] if self.keep_last > 0 else [])
+        if self.keep_best is not None:
+            rewarded = [e for e in episodes if checkpoints[str(e)]["eval_reward"] is not None]
+            rewarded.sort(key=lambda e: checkpoints[str(e)]["eval_reward"], reverse=True)
+            keep.update(rewarded[:self.keep_best])
+        # delta checkpoints need their whole chain of bases
+        for episode in list(keep):
+            base = checkpoints[str(episode)]["base"]
+            while base is not None:
+                keep.add(base)
+                base = checkpoints[str(base)]["base"]
+
+        for episode in episodes:
+            if episode not in keep:
+                self.index["garbage"] += checkpoints.pop(str(episode))["length"]
+
+        live = sum(entry["length"] for entry in checkpoints.values())
+        if self.index["garbage"] > live:
+            self.compact()
+
+    def compact(self):
+        """
+            rewrites the archive without the records of dropped checkpoints
+        """
+        tmp_path = self.archive_path + ".tmp"
+        with open(self.archive_path, "rb") as archive, open(tmp_path, "wb") as compacted:
+            for episode in sorted(self.index["checkpoints"], key=int):
+                entry = self.index["checkpoints"][episode]
+                archive.seek(entry["offset"])
+                record = archive.read(entry["length"])
+                entry["offset"] = compacted.tell()
+                compacted.write(record)
+        os.replace(tmp_path, self.archive_path)
+        self.index["garbage"] = 0
+
+    def write_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(self.index, index_file)
+        os.replace(tmp_path, self.index_path)
+
+    def load_arrays(self, episode):
+        """
+            param:
+                episode: episode of the checkpoint
+            return:
+                dict of float32 numpy arrays, reads only this record and its delta bases
+        """
+        with self.lock:
+            entry = dict(self.index["checkpoints"][str(episode)])
+            with open(self.archive_path, "rb") as archive:
+                archive.seek(entry["offset"])
+                record = archive.read(entry["length"])
+        with np.load(io.BytesIO(record), allow_pickle=False) as stored:
+            arrays = {name: stored[name].astype(np.float32) for name in stored.files}
+        if entry["base"] is not None:
+            base = self.load_arrays(entry["base"])
+            arrays = {name: base[name] + arrays[name] for name in arrays}
+        return arrays
+
+    def load_state_dict(self, episode):
+        import torch
+        return {name: torch.from_numpy(array) for name, array in self.load_arrays(episode).items()}
+
+    def load_model(self, episode=None):
+        """
+            param:
+                episode: episode of the checkpoint, None loads the latest
+            return:
+                DQN with the stored weights, in eval mode
+        """
+        from dqn import DQN
+        if episode is None:
+            episode = self.episodes()[-1]
+        model = DQN(self.index["state_dim"], self.index["action_dim"])
+        model.load_state_dict(self.load_state_dict(episode))
+        model.eval()
+        return model
+
+
+def load_dqn(path, episode=None):
+    """
+        param:
+            path: run directory written by CheckpointStore, or a model saved with torch.save
+            episode: episode to load from a run directory, None loads the latest
+        return:
+            the DQN in eval mode
+    """
+    if os.path.isdir(path):
+        return CheckpointStore(path).load_model(episode)
+    import torch
+    model = torch.load(path, map_location=None if torch.cuda.is_available() else "cpu")
+    model.eval()
+    return model
@@ -0,0 +1,231 @@
+# compact exports of a trained DQN for cheap CPU acting
+#   <out>.npz     : float32 weights, acted on with a plain numpy matmul chain (no torch needed)
+#   <out>.int8.pt : int8 dynamically quantized linear layers
+import argparse
+import os
+import time
+import numpy as np
+from checkpoint_store import load_dqn
+
+LAYERS = ["fc1", "fc2", "fc3"]
+
+
+def to_numpy(x):
+    """
+        param:
+            x: numpy array or torch tensor
+        return:
+            x as a numpy array
+    """
+    if isinstance(x, np.ndarray):
+        return x
+    return x.detach().cpu().numpy()
+
+
+class NumpyDQN:
+    def __init__(self, weights):
+        """
+            param:
+                weights: dict with fc1_weight, fc1_bias, ..., fc3_bias arrays laid out as in nn.Linear
+        """
+        self.weights = [(np.ascontiguousarray(weights[layer + "_weight"].T, dtype=np.float32),
+                         np.asarray(weights[layer + "_bias"], dtype=np.float32)) for layer in LAYERS]
+        self.state_dim = self.weights[0][0].shape[0]
+        self.action_dim = self.weights[-1][0].shape[1]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as weights:
+            return cls(dict(weights))
+
+    def forward(self, state):
+        """
+            param:
+                state: batch of states, shape: (N, |S|)
+            return:
+                q: Q-value, (N, action_dim)
+        """
+        x = np.asarray(state, dtype=np.float32)
+        for i, (weight, bias) in enumerate(self.weights):
+            x = x @ weight + bias
+            if i < len(self.weights) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def forward_best_actions(self, state):
+        """
+            param:
+                state: batch of states, shape: (N, |S|)
+            return:
+                best_action: indexes of best action, shape: (N,)
+                best_q: Q(state, best_action), shape: (N,)
+        """
+        q = self.forward(state)
+        best_action = np.argmax(q, axis=1)
+        return best_action, q[np.arange(len(q)), best_action]
+
+    def nbytes(self):
+        return sum(weight.nbytes + bias.nbytes for weight, bias in self.weights)
+
+
+class Int8DQN:
+    def __init__(self, quantized):
+        """
+            param:
+                quantized: DQN whose linear layers were dynamically quantized to int8, on the cpu
+        """
+        self.quantized = quantized
+        self.state_dim = quantized.state_dim
+        self.action_dim = quantized.action_dim
+
+    def forward(self, state):
+        import torch
+        import torch.nn.functional as F
+        with torch.no_grad():
+            x = torch.as_tensor(np.asarray(state, dtype=np.float32))
+            x = F.relu(self.quantized.fc1(x))
+            x = F.relu(self.quantized.fc2(x))
+            return self.quantized.fc3(x)
+
+    def forward_best_actions(self, state):
+        import torch
+        best_q, best_action = torch.max(self.forward(state), 1)
+        return best_action, best_q
+
+
+def numpy_weights(model):
+    """
+        param:
+            model: DQN
+        return:
+            dict of float32 numpy weights, see NumpyDQN
+    """
+    state_dict = model.state_dict()
+    weights = {}
+    for layer in LAYERS:
+        weights[layer + "_weight"] = to_numpy(state_dict[layer + ".weight"]).astype(np.float32)
+        weights[layer + "_bias"] = to_numpy(state_dict[layer + ".bias"]).astype(np.float32)
+    return weights
+
+
+def quantize_int8(model):
+    """
+        param:
+            model: DQN
+        return:
+            copy of model on the cpu with int8 dynamically quantized linear layers
+    """
+    import torch
+    from dqn import DQN
+    float_cpu = DQN(model.state_dim, model.action_dim).cpu()
+    float_cpu.load_state_dict({k: v.cpu() for k, v in model.state_dict().items()})
+    return torch.quantization.quantize_dynamic(float_cpu, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_npz(model, path):
+    np.savez(path, **numpy_weights(model))
+
+
+def export_int8(model, path):
+    import torch
+    torch.save({"state_dim": model.state_dim, "action_dim": model.action_dim, "state_dict": quantize_int8(model).state_dict()}, path)
+
+
+def load_policy(path, episode=None):
+    """
+        param:
+            path: .npz or .int8.pt export, a run directory of CheckpointStore or a model saved with torch.save
+            episode: episode to load from a run directory, None loads the latest
+        return:
+            object with forward and forward_best_actions
+    """
+    if path.endswith(".npz"):
+        return NumpyDQN.load(path)
+
+    import torch
+    from dqn import DQN
+    if path.endswith(".int8.pt"):
+        checkpoint = torch.load(path, map_location="cpu")
+        quantized = quantize_int8(DQN(checkpoint["state_dim"], checkpoint["action_dim"]))
+        quantized.load_state_dict(checkpoint["state_dict"])
+        return Int8DQN(quantized)
+    return load_dqn(path, episode)
+
+
+def time_per_call(fn, states, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(states)
+    return (time.perf_counter() - start) / repeats
+
+
+def compare(policies, states, single_calls=1000, batch_repeats=20):
+    """
+        param:
+            policies: dict of name to policy, must contain "float"
+            states: held-out states, shape: (N, |S|)
+            single_calls: number of single-state calls timed
+            batch_repeats: number of full-batch calls timed
+        return:
+            None, prints agreement with the float policy and timings
+    """
+    import torch
+    reference = to_numpy(policies["float"].forward_best_actions(states)[0])
+    single_states = [states[i:i + 1] for i in range(min(single_calls, len(states)))]
+    for name, policy in policies.items():
+        with torch.no_grad():
+            actions = to_numpy(policy.forward_best_actions(states)[0])
+            batch_time = time_per_call(policy.forward_best_actions, states, batch_repeats)
+            start = time.perf_counter()
+            for state in single_states:
+                policy.forward_best_actions(state)
+            single_time = (time.perf_counter() - start) / len(single_states)
+        print("{:>6}: agreement {:.4f}, single state {:.1f}us, batch of {} {:.2f}ms".format(
+            name, np.mean(actions == reference), 1e6 * single_time, len(states), 1000 * batch_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="export a trained model to numpy / int8 and check it against the float model")
+    parser.add_argument("model_name", help="path to model or run directory to export", type=str)
+    parser.add_argument('--episode', dest='episode', default=None, help="episode to export from a run directory, defaults to the latest", type=int)
+    parser.add_argument('--out', dest='out', default=None, help="output path prefix, defaults to model path without extension", type=str)
+    parser.add_argument('--env_name', dest='env_name', default="LunarLander-v2", help="gym environment used for held-out states", type=str)
+    parser.add_argument('--holdout_episodes', dest='holdout_episodes', default=20, help="episodes collected for held-out states", type=int)
+    parser.add_argument('--epsilon', dest='epsilon', default=0.5, help="epsilon of the policy collecting held-out states", type=float)
+    args = parser.parse_args()
+
+    import gym
+    from run import collect_trajectories
+
+    model = load_policy(args.model_name, args.episode)
+    if args.out:
+        out = args.out
+    elif os.path.isdir(args.model_name):
+        out = os.path.join(args.model_name, "dqn_{}".format(args.episode if args.episode is not None else "latest"))
+    else:
+        out = os.path.splitext(args.model_name)[0]
+    export_npz(model, out + ".npz")
+    export_int8(model, out + ".int8.pt")
+
+    policies = {
+        "float": model,
+        "int8": load_policy(out + ".int8.pt"),
+        "numpy": load_policy(out + ".npz"),
+    }
+
+    env = gym.make(args.env_name)
+    trajectories = collect_trajectories(env, args.holdout_episodes, sarsa=False, dqn=policies["numpy"], epsilon=args.epsilon)
+    env.close()
+    states = np.array([sarsa[0] for traj in trajectories for sarsa in traj], dtype=np.float32)
+    compare(policies, states)
+
+    float_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    print("float parameters {:.1f}KB, {} {:.1f}KB, {} {:.1f}KB, numpy in memory {:.1f}KB".format(
+        float_bytes / 1024,
+        out + ".int8.pt", os.path.getsize(out + ".int8.pt") / 1024,
+        out + ".npz", os.path.getsize(out + ".npz") / 1024,
+        policies["numpy"].nbytes() / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import time
+import torch
+
+
+def parse_cores(cores):
+    """
+        param:
+            cores: string of comma separated core ids and ranges, e.g. "0-3,8,10-11"
+        return:
+            sorted list of int core ids, None if cores is None or empty
+    """
+    if not cores:
+        return None
+    parsed = set()
+    for part in cores.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            parsed.update(range(int(start), int(end) + 1))
+        else:
+            parsed.add(int(part))
+    return sorted(parsed)
+
+
+def available_cores():
+    """
+        return:
+            sorted list of core ids the current process may run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def pin_to_cores(cores):
+    """
+        param:
+            cores: list of core ids to pin the current process to
+        return:
+            list of core ids the process is pinned to afterwards
+    """
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    elif cores:
+        print("CPU affinity is not supported on this platform, ignoring core list")
+    return available_cores()
+
+
+def configure(intra_op_threads=None, inter_op_threads=None, cpu_cores=None, rank=0, world_size=1):
+    """
+        param:
+            intra_op_threads: size of the torch intra-op thread pool, None keeps the torch default
+            inter_op_threads: size of the torch inter-op thread pool, None keeps the torch default
+            cpu_cores: string of cores for the rollout and learner work, split evenly between ranks
+            rank: index of this learner process
+            world_size: number of learner processes sharing cpu_cores
+        return:
+            dict describing the applied configuration
+    """
+    cores = parse_cores(cpu_cores)
+    if cores and world_size > 1:
+        per_rank = max(1, len(cores) // world_size)
+        cores = cores[rank * per_rank:(rank + 1) * per_rank] or cores[-per_rank:]
+    cores = pin_to_cores(cores)
+
+    if inter_op_threads is not None:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # can only be set once, before any inter-op parallel work has started
+            print("Could not set inter-op threads: {}".format(e))
+    if intra_op_threads is not None:
+        torch.set_num_threads(intra_op_threads)
+
+    return {
+        "cpu_cores": cores,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+    }
+
+
+def pin_loader_worker(loader_cores, worker_id):
+    """
+        worker_init_fn for DataLoader workers, use with functools.partial
+        param:
+            loader_cores: list of core ids for DataLoader workers, None leaves affinity alone
+            worker_id: id of the DataLoader worker
+    """
+    torch.set_num_threads(1)
+    if loader_cores:
+        pin_to_cores([loader_cores[worker_id % len(loader_cores)]])
+
+
+def candidate_thread_counts(cores):
+    """
+        param:
+            cores: list of core ids available to the learner
+        return:
+            powers of two up to the number of cores, plus the number of cores itself
+    """
+    n_cores = max(1, len(cores))
+    candidates = []
+    n = 1
+    while n < n_cores:
+        candidates.append(n)
+        n *= 2
+    candidates.append(n_cores)
+    return candidates
+
+
+def autotune_intra_op_threads(step_fn, candidates, warmup_steps=5, timed_steps=50):
+    """
+        param:
+            step_fn: function running one training step, called without arguments
+            candidates: list of intra-op thread counts to try
+            warmup_steps: untimed steps run before timing each candidate
+            timed_steps: timed steps run for each candidate
+        return:
+            best: fastest intra-op thread count, left applied
+            timings: dict of thread count to mean seconds per step
+    """
+    timings = {}
+    for n_threads in candidates:
+        torch.set_num_threads(n_threads)
+        for _ in range(warmup_steps):
+            step_fn()
+        start = time.perf_counter()
+        for _ in range(timed_steps):
+            step_fn()
+        timings[n_threads] = (time.perf_counter() - start) / timed_steps
+        print("Autotune: {} intra-op threads, {:.3f} ms/step".format(n_threads, 1000 * timings[n_threads]))
+
+    best = min(timings, key=timings.get)
+    torch.set_num_threads(best)
+    return best, timings
@@ -0,0 +1,86 @@
+import os
+import numpy as np
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+
+def launch(train_fn, world_size, train_kwargs, master_addr="127.0.0.1", master_port=29500):
+    """
+        param:
+            train_fn: training function, called as train_fn(**train_kwargs, rank=rank, world_size=world_size)
+            world_size: int indicating number of local learner processes to spawn
+            train_kwargs: dict of keyword arguments passed to train_fn
+            master_addr: address used for the gloo rendezvous
+            master_port: port used for the gloo rendezvous
+        return:
+            None
+    """
+    mp.spawn(_worker,
+             args=(world_size, train_fn, train_kwargs, master_addr, master_port),
+             nprocs=world_size,
+             join=True)
+
+
+def _worker(rank, world_size, train_fn, train_kwargs, master_addr, master_port):
+    os.environ["MASTER_ADDR"] = master_addr
+    os.environ["MASTER_PORT"] = str(master_port)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        train_fn(**train_kwargs, rank=rank, world_size=world_size)
+    finally:
+        dist.destroy_process_group()
+
+
+def broadcast_parameters(module, src=0):
+    """
+        param:
+            module: nn.Module whose parameters are overwritten with those of rank src
+            src: rank holding the reference parameters
+        return:
+    """
+    with torch.no_grad():
+        for param in module.parameters():
+            dist.broadcast(param.data, src=src)
+
+
+def all_reduce_gradients(module, world_size):
+    """
+        param:
+            module: nn.Module whose gradients are averaged across all ranks
+            world_size: number of ranks taking part
+        return:
+    """
+    for param in module.parameters():
+        if param.grad is None:
+            continue
+        dist.all_reduce(param.grad.data, op=dist.ReduceOp.SUM)
+        param.grad.data /= world_size
+
+
+def broadcast_transition(transition, obs_space_dim, src=0):
+    """
+        param:
+            transition: [s, a, r, s_prime, done] on rank src, ignored on every other rank
+            obs_space_dim: int representing dimension of state vector
+            src: rank that stepped the environment
+        return:
+            the transition of rank src as [s, a, r, s_prime, done] on every rank
+    """
+    flat = torch.zeros(2 * obs_space_dim + 3, dtype=torch.float64)
+    if dist.get_rank() == src:
+        s, a, r, s_prime, done = transition
+        flat = torch.tensor([*s, a, r, *s_prime, done], dtype=torch.float64)
+    dist.broadcast(flat, src=src)
+
+    flat = flat.numpy()
+    s = flat[:obs_space_dim]
+    a = int(flat[obs_space_dim])
+    r = float(flat[obs_space_dim + 1])
+    s_prime = flat[obs_space_dim + 2: 2 * obs_space_dim + 2]
+    done = int(flat[2 * obs_space_dim + 2])
+    return [np.array(s), a, r, np.array(s_prime), done]
+
+
+def barrier():
+    dist.barrier()
@@ -0,0 +1,69 @@
+import numpy as np
+import torch
+from torch import optim
+import torch.distributed as dist
+import data_parallel
+from dqn import DQN
+from trajectory_dataset import TrajectoryDataset
+from train_dqn import compute_loss, unpack_dataloader_sarsd
+
+# checks on one cpu-only machine that data-parallel learners stay in sync:
+#   python data_parallel_test.py
+
+OBS_DIM = 8
+ACTION_DIM = 4
+
+
+def random_transition():
+    return [np.random.randn(OBS_DIM), np.random.randint(ACTION_DIM), np.random.randn(), np.random.randn(OBS_DIM), int(np.random.rand() < 0.1)]
+
+
+def flat_parameters(module):
+    return torch.cat([param.detach().cpu().reshape(-1) for param in module.parameters()])
+
+
+def assert_same_on_all_ranks(tensor, world_size, name):
+    gathered = [torch.zeros_like(tensor) for _ in range(world_size)]
+    dist.all_gather(gathered, tensor)
+    for rank, other in enumerate(gathered):
+        assert torch.equal(gathered[0], other), "{} differs between rank 0 and rank {}".format(name, rank)
+
+
+def check(rank=0, world_size=1, steps=20, batch_size=8):
+    # different seeds so that the networks start out different before the broadcast
+    torch.manual_seed(rank)
+    np.random.seed(rank)
+
+    dqn = DQN(OBS_DIM, ACTION_DIM)
+    dqn_prime = DQN(OBS_DIM, ACTION_DIM)
+    data_parallel.broadcast_parameters(dqn)
+    assert_same_on_all_ranks(flat_parameters(dqn), world_size, "dqn after broadcast")
+    optimizer = optim.Adam(dqn.parameters(), lr=0.001)
+
+    dataset = TrajectoryDataset(data_parallel.broadcast_transition(random_transition() if rank == 0 else None, OBS_DIM), max_replay_history=100)
+    dataloader = torch.utils.data.DataLoader(dataset, batch_size=batch_size // world_size, sampler=torch.utils.data.RandomSampler(dataset))
+
+    for step in range(steps):
+        if step % 5 == 0:
+            dqn_prime.load_state_dict(dqn.state_dict())
+        dataset.add_transition(data_parallel.broadcast_transition(random_transition() if rank == 0 else None, OBS_DIM))
+        s, a, r, s_prime, done, n = unpack_dataloader_sarsd(next(iter(dataloader)), OBS_DIM)
+        loss = compute_loss(s, a, r, s_prime, done, dqn, 0.99, dqn_prime, n)
+        optimizer.zero_grad()
+        loss.backward()
+        data_parallel.all_reduce_gradients(dqn, world_size)
+        optimizer.step()
+
+    assert_same_on_all_ranks(dataset.transitions[:len(dataset)].cpu(), world_size, "replay buffer")
+    assert_same_on_all_ranks(flat_parameters(dqn), world_size, "dqn")
+    assert_same_on_all_ranks(flat_parameters(dqn_prime), world_size, "dqn_prime")
+    if rank == 0:
+        print("dqn and dqn_prime identical on {} ranks after {} steps".format(world_size, steps))
+
+
+def main():
+    data_parallel.launch(check, 2, {}, master_port=29511)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import argparse
 from train_dqn import train
 import constants
+import data_parallel
 
 def main():
     """
@@ -18,6 +19,13 @@ def main():
                                     batch size for gradient update
             --n_threads N_THREADS
                                     number of threads to use
+            --intra_op_threads, --inter_op_threads
+                                    torch thread pool sizes
+            --cpu_cores CPU_CORES, --loader_cores LOADER_CORES
+                                    cores to pin learner / DataLoader workers to
+            --autotune_threads    pick intra-op threads by benchmarking the training step
+            --world_size WORLD_SIZE
+                                    number of local data-parallel learner processes
         returns:
     """
 
@@ -44,9 +52,25 @@ def main():
     parser.add_argument('--gd_optimizer', dest='gd_optimizer', default="RMSprop", help = "what optimizer to use", type=str)
     parser.add_argument('--num_episodes', dest='num_episodes', default=50000, help = "number of episodes to perform", type=int)
     parser.add_argument('--decay', dest="decay", default=None, help="decay rate of epsilon", type=float)
+    parser.add_argument('--world_size', dest='world_size', default=1, help="number of local data-parallel learner processes (gloo backend)", type=int)
+    parser.add_argument('--intra_op_threads', dest='intra_op_threads', default=None, help="size of the torch intra-op thread pool", type=int)
+    parser.add_argument('--inter_op_threads', dest='inter_op_threads', default=None, help="size of the torch inter-op thread pool", type=int)
+    parser.add_argument('--cpu_cores', dest='cpu_cores', default=None, help="cores to pin rollout and learner work to, e.g. 0-3,8", type=str)
+    parser.add_argument('--loader_cores', dest='loader_cores', default=None, help="cores to pin DataLoader workers to, e.g. 4-7", type=str)
+    parser.add_argument('--autotune_threads', dest='autotune_threads', action='store_true', help="benchmark the training step at startup to pick intra-op threads")
+    parser.set_defaults(autotune_threads=False)
+    parser.add_argument('--n_step', dest='n_step', default=1, help="number of rewards summed into each replay transition before bootstrapping", type=int)
+    parser.add_argument('--checkpoint_encoding', dest='checkpoint_encoding', default="float32", help="float32, float16 or delta encoding of saved models", type=str)
+    parser.add_argument('--keep_last', dest='keep_last', default=None, help="keep only the last N saved models", type=int)
+    parser.add_argument('--keep_best', dest='keep_best', default=None, help="also keep the N saved models with the best eval reward", type=int)
+    parser.add_argument('--warm_start_episodes', dest='warm_start_episodes', default=0, help="number of cached random-policy episodes to start the replay buffer with", type=int)
+    parser.add_argument('--warm_start_seed', dest='warm_start_seed', default=0, help="seed of the cached random-policy episodes", type=int)
+    parser.add_argument('--replay_cache_dir', dest='replay_cache_dir', default="./replay_cache/", help="directory of the warm start replay cache", type=str)
+    parser.add_argument('--run_name', dest='run_name', default=None, help="name of the run, defaults to its start time", type=str)
+    parser.add_argument('--master_port', dest='master_port', default=29500, help="port used by the data-parallel learner processes to rendezvous", type=int)
     args = parser.parse_args()
 
-    train(
+    train_kwargs = dict(
         learning_rate=args.learning_rate,
         discount_factor=args.discount_factor,
         env_name=args.env_name,
@@ -65,9 +89,27 @@ def main():
         eval_episodes=args.eval_episodes,
         gd_optimizer=args.gd_optimizer,
         num_episodes=args.num_episodes,
-        decay=args.decay
+        decay=args.decay,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        cpu_cores=args.cpu_cores,
+        loader_cores=args.loader_cores,
+        autotune_threads=args.autotune_threads,
+        run_name=args.run_name,
+        n_step=args.n_step,
+        checkpoint_encoding=args.checkpoint_encoding,
+        keep_last=args.keep_last,
+        keep_best=args.keep_best,
+        warm_start_episodes=args.warm_start_episodes,
+        warm_start_seed=args.warm_start_seed,
+        replay_cache_dir=args.replay_cache_dir
     )
 
+    if args.world_size > 1:
+        data_parallel.launch(train, args.world_size, train_kwargs, master_port=args.master_port)
+    else:
+        train(**train_kwargs)
+
     
 
 if __name__ == "__main__":
@@ -0,0 +1,51 @@
+# load generator for policy_server.py
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from policy_server import latency_report
+
+
+async def client(host, port, n_requests, state_dim, want_q, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(n_requests):
+            request = {"obs": np.random.randn(state_dim).tolist(), "q": want_q}
+            start = time.perf_counter()
+            writer.write((json.dumps(request) + "\n").encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if "error" in response:
+                print("Server error: {}".format(response["error"]))
+                break
+    finally:
+        writer.close()
+
+
+async def run(host, port, clients, n_requests, state_dim, want_q):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, n_requests, state_dim, want_q, latencies) for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    print("{} clients, {:.1f} requests/s".format(clients, len(latencies) / elapsed))
+    print("client latency {}".format(latency_report(latencies)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="send concurrent random observations to policy_server.py")
+    parser.add_argument('--host', dest='host', default="127.0.0.1", help="address of the policy server", type=str)
+    parser.add_argument('--port', dest='port', default=8765, help="port of the policy server", type=int)
+    parser.add_argument('--clients', dest='clients', default=32, help="number of concurrent clients", type=int)
+    parser.add_argument('--requests', dest='requests', default=1000, help="number of requests per client", type=int)
+    parser.add_argument('--state_dim', dest='state_dim', default=8, help="dimension of the observations sent", type=int)
+    parser.add_argument('--q', dest='q', action='store_true', help="request q values as well as actions")
+    parser.set_defaults(q=False)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.host, args.port, args.clients, args.requests, args.state_dim, args.q))
+
+
+if __name__ == "__main__":
+    main()
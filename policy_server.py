@@ -0,0 +1,166 @@
+# serve greedy actions / q values of a trained DQN to many clients
+#
+# protocol: one JSON object per line in each direction
+#   request:  {"obs": [...], "q": false}
+#   response: {"action": int} or {"action": int, "q": [...]} when "q" is true, {"error": str} on bad input
+import argparse
+import asyncio
+import collections
+import json
+import time
+import numpy as np
+import torch
+from compact_policy import load_policy, to_numpy
+
+
+def latency_report(latencies):
+    """
+        param:
+            latencies: list of latencies in seconds
+        return:
+            string with count and p50 / p90 / p99 / max latency in ms
+    """
+    if not latencies:
+        return "no requests"
+    ms = 1000 * np.asarray(latencies)
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return "n={} p50={:.2f}ms p90={:.2f}ms p99={:.2f}ms max={:.2f}ms".format(len(ms), p50, p90, p99, ms.max())
+
+
+class MicroBatcher:
+    def __init__(self, model, max_batch_size=64, max_wait_ms=2.0):
+        """
+            param:
+                model: object with forward(states) returning q values of shape (N, action_dim)
+                max_batch_size: largest number of requests evaluated in one forward pass
+                max_wait_ms: longest time the first request of a batch waits for more requests
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.latencies = []
+        self.batch_sizes = collections.Counter()
+
+    async def submit(self, obs):
+        """
+            param:
+                obs: single observation
+            return:
+                q values for obs as numpy array of shape (action_dim,)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((obs, future, time.perf_counter()))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                states = np.stack([obs for obs, _, _ in batch])
+                q = await loop.run_in_executor(None, self.forward, states)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            self.batch_sizes[len(batch)] += 1
+            for i, (_, future, start) in enumerate(batch):
+                self.latencies.append(now - start)
+                if not future.done():
+                    future.set_result(q[i])
+
+    def forward(self, states):
+        with torch.no_grad():
+            return to_numpy(self.model.forward(states))
+
+    def report(self):
+        """
+            return:
+                string with latency percentiles and batch size histogram since the last report
+        """
+        histogram = " ".join("{}:{}".format(size, self.batch_sizes[size]) for size in sorted(self.batch_sizes))
+        text = "latency {} | batch sizes {}".format(latency_report(self.latencies), histogram)
+        self.latencies = []
+        self.batch_sizes = collections.Counter()
+        return text
+
+
+async def handle_client(batcher, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                obs = np.asarray(request["obs"], dtype=np.float32)
+                if obs.shape != (batcher.model.state_dim,):
+                    raise ValueError("obs has shape {}, expected ({},)".format(obs.shape, batcher.model.state_dim))
+                q = await batcher.submit(obs)
+                response = {"action": int(np.argmax(q))}
+                if request.get("q", False):
+                    response["q"] = q.tolist()
+            except (ValueError, KeyError, TypeError, RuntimeError) as e:
+                response = {"error": str(e)}
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def report_loop(batcher, report_every):
+    while True:
+        await asyncio.sleep(report_every)
+        print(batcher.report(), flush=True)
+
+
+async def serve(model, host, port, max_batch_size, max_wait_ms, report_every):
+    batcher = MicroBatcher(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = await asyncio.start_server(lambda r, w: handle_client(batcher, r, w), host, port)
+    print("Serving policy on {}:{}".format(host, port), flush=True)
+    tasks = [asyncio.ensure_future(batcher.run()), asyncio.ensure_future(report_loop(batcher, report_every))]
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        print(batcher.report(), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve greedy actions / q values of a trained model over a local socket")
+    parser.add_argument("model_name", help="path to model to serve, .npz and .int8.pt exports of compact_policy.py are served without autograd", type=str)
+    parser.add_argument('--episode', dest='episode', default=None, help="episode to serve from a run directory, defaults to the latest", type=int)
+    parser.add_argument('--host', dest='host', default="127.0.0.1", help="address to listen on", type=str)
+    parser.add_argument('--port', dest='port', default=8765, help="port to listen on", type=int)
+    parser.add_argument('--max_batch_size', dest='max_batch_size', default=64, help="largest micro-batch", type=int)
+    parser.add_argument('--max_wait_ms', dest='max_wait_ms', default=2.0, help="longest wait for a micro-batch to fill", type=float)
+    parser.add_argument('--report_every', dest='report_every', default=10.0, help="seconds between latency reports", type=float)
+    args = parser.parse_args()
+
+    model = load_policy(args.model_name, args.episode)
+    try:
+        asyncio.run(serve(model, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.report_every))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# persistent cache of random-policy transitions used to warm start the replay buffer
+#
+# <cache_dir>/<env_name>_<episodes>_<seed>.npy holds float32 rows [*s, a, r, *s_prime, done, 1] in episode order,
+# the row layout of TrajectoryDataset, so it can be memory-mapped straight into the dataset
+import os
+import numpy as np
+
+
+def cache_path(env_name, episodes, seed, cache_dir="./replay_cache/"):
+    return os.path.join(cache_dir, "{}_{}_{}.npy".format(env_name, episodes, seed))
+
+
+def collect_random_transitions(env_name, episodes, seed):
+    """
+        param:
+            env_name: name of the gym environment
+            episodes: number of random-policy episodes to run
+            seed: seed of the environment and its action space
+        return:
+            float32 array of rows [*s, a, r, *s_prime, done, 1]
+    """
+    import gym
+    env = gym.make(env_name)
+    env.seed(seed)
+    env.action_space.seed(seed)
+
+    rows = []
+    for i_episode in range(episodes):
+        observation = env.reset()
+        while True:
+            action = env.action_space.sample()
+            observation_, reward, done, info = env.step(action)
+            terminal = 1 if done else 0
+            rows.append([*np.ravel(observation), action, reward, *np.ravel(observation_), terminal, 1])
+            observation = observation_
+            if done:
+                break
+    env.close()
+    return np.asarray(rows, dtype=np.float32)
+
+
+def load_or_collect(env_name, episodes, seed, cache_dir="./replay_cache/"):
+    """
+        param:
+            env_name: name of the gym environment
+            episodes: number of random-policy episodes in the cache
+            seed: seed used to collect them
+            cache_dir: directory of the cache files
+        return:
+            copy-on-write memory map of the cached rows, collected and written first if missing
+    """
+    path = cache_path(env_name, episodes, seed, cache_dir)
+    if not os.path.isfile(path):
+        print("Collecting {} random episodes of {} into {}".format(episodes, env_name, path))
+        os.makedirs(cache_dir, exist_ok=True)
+        transitions = collect_random_transitions(env_name, episodes, seed)
+        # concurrent runs may fill the same cache, only ever expose complete files
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as cache_file:
+            np.save(cache_file, transitions)
+        os.replace(tmp_path, path)
+    else:
+        print("Using replay cache {}".format(path))
+    return np.load(path, mmap_mode="c")
@@ -15,7 +15,7 @@ def collect_trajectories(env, episodes, timesteps=None, sarsa=True, dqn=None, re
 			if render:
 				env.render()
 			if dqn and random.random() > epsilon:
-				action = torch.squeeze(dqn.forward_best_actions([observation])[0]).item()
+				action = int(dqn.forward_best_actions([observation])[0][0])
 			else: 
 				action = env.action_space.sample()  # random sample of action space
 			observation, reward, done, info = env.step(action)
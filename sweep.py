@@ -0,0 +1,284 @@
+# run a hyper parameter sweep of train() on a local process pool, stopping losers early with successive halving
+#
+# a sweep spec is a json file:
+#   {
+#       "base":   {train() keyword arguments shared by every trial},
+#       "grid":   {train() keyword argument: [values], ...},    every combination becomes a trial
+#       "trials": [{train() keyword arguments}, ...]            optional extra trials, merged onto base
+#   }
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+
+def expand_spec(spec):
+    """
+        param:
+            spec: sweep spec dict, see top of file
+        return:
+            list of train() keyword argument dicts, one per trial
+    """
+    base = spec.get("base", {})
+    trials = []
+    grid = spec.get("grid", {})
+    if grid:
+        keys = sorted(grid)
+        for values in itertools.product(*[grid[key] for key in keys]):
+            trials.append({**base, **dict(zip(keys, values))})
+    for trial in spec.get("trials", []):
+        trials.append({**base, **trial})
+    if not trials:
+        trials.append(dict(base))
+    return trials
+
+
+def trial_id(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def default_parallel(threads_per_trial, mem_per_trial_gb):
+    """
+        param:
+            threads_per_trial: cores given to each trial
+            mem_per_trial_gb: memory each trial is expected to use
+        return:
+            number of trials that fit on this machine at once
+    """
+    if hasattr(os, "sched_getaffinity"):
+        n_cores = len(os.sched_getaffinity(0))
+    else:
+        n_cores = os.cpu_count()
+    parallel = max(1, n_cores // threads_per_trial)
+
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    mem_gb = int(line.split()[1]) / 1024 ** 2
+                    parallel = min(parallel, max(1, int(mem_gb // mem_per_trial_gb)))
+    except OSError:
+        pass
+    return parallel
+
+
+def rungs(min_progress, eta, max_progress):
+    """
+        return:
+            episodes (or iterations) at which trials are compared: min_progress * eta^k below max_progress
+    """
+    milestones = []
+    progress = min_progress
+    while progress < max_progress:
+        milestones.append(progress)
+        progress *= eta
+    return milestones
+
+
+def read_avg_reward(run_name):
+    """
+        param:
+            run_name: name of a run started by train()
+        return:
+            array of (episode, AvgReward) rows logged so far, None if nothing was logged yet
+    """
+    path = "./metrics/{}.npy".format(run_name)
+    if not os.path.isfile(path):
+        return None
+    try:
+        metrics = np.load(path, allow_pickle=True)
+    except (OSError, ValueError, EOFError):
+        # file is being rewritten by the trial
+        return None
+    if len(metrics) == 0:
+        return None
+    return np.asarray(metrics[:, :2], dtype=float)
+
+
+class Sweep:
+    def __init__(self, spec_path, sweep_dir, parallel, threads_per_trial, min_progress, eta, smooth, poll_interval):
+        with open(spec_path) as spec_file:
+            self.trials_params = expand_spec(json.load(spec_file))
+        self.sweep_dir = sweep_dir
+        self.state_path = os.path.join(sweep_dir, "state.json")
+        self.parallel = parallel
+        self.threads_per_trial = threads_per_trial
+        self.min_progress = min_progress
+        self.eta = eta
+        self.smooth = smooth
+        self.poll_interval = poll_interval
+        self.processes = {}
+        self.state = self.load_state()
+
+    def load_state(self):
+        state = {"trials": {}}
+        if os.path.isfile(self.state_path):
+            with open(self.state_path) as state_file:
+                state = json.load(state_file)
+        for params in self.trials_params:
+            state["trials"].setdefault(trial_id(params), {
+                "params": params,
+                "status": "pending",
+                "attempt": 0,
+                "run_name": None,
+                "rungs": {},
+                "score": None,
+            })
+        for trial in state["trials"].values():
+            if trial["status"] == "running":
+                # interrupted, start over under a new run name
+                trial["status"] = "pending"
+                trial["rungs"] = {}
+        return state
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(self.state, state_file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def max_progress(self, params):
+        if params.get("online", True):
+            return params.get("num_episodes", 50000)
+        return params.get("iterations", 50000)
+
+    def launch(self, tid):
+        trial = self.state["trials"][tid]
+        trial["attempt"] += 1
+        trial["run_name"] = "sweep_{}_{}_{}".format(os.path.basename(os.path.normpath(self.sweep_dir)), tid, trial["attempt"])
+        trial["status"] = "running"
+        params = dict(trial["params"], run_name=trial["run_name"])
+        params.setdefault("intra_op_threads", self.threads_per_trial)
+        log = open(os.path.join(self.sweep_dir, trial["run_name"] + ".log"), "w")
+        self.processes[tid] = subprocess.Popen([sys.executable, os.path.abspath(__file__), "trial", json.dumps(params)],
+                                               stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        print("Started trial {} {}".format(tid, trial["params"]))
+
+    def stop(self, tid, status):
+        process = self.processes.pop(tid)
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
+        self.state["trials"][tid]["status"] = status
+
+    def score(self, avg_reward, progress):
+        logged = avg_reward[avg_reward[:, 0] <= progress]
+        return float(np.mean(logged[-self.smooth:, 1]))
+
+    def check_rungs(self, tid):
+        """
+            record the score of trial tid at every rung it reached and stop it if it is not in the top 1 / eta
+            of the trials that reached that rung
+        """
+        trial = self.state["trials"][tid]
+        avg_reward = read_avg_reward(trial["run_name"])
+        if avg_reward is None:
+            return
+        trial["score"] = self.score(avg_reward, avg_reward[-1, 0])
+        for rung in rungs(self.min_progress, self.eta, self.max_progress(trial["params"])):
+            key = str(rung)
+            if avg_reward[-1, 0] < rung:
+                break
+            if key in trial["rungs"]:
+                continue
+            trial["rungs"][key] = self.score(avg_reward, rung)
+            peers = sorted([other["rungs"][key] for other in self.state["trials"].values() if key in other["rungs"]], reverse=True)
+            if len(peers) < self.eta:
+                continue
+            keep = max(1, len(peers) // self.eta)
+            if trial["rungs"][key] < peers[keep - 1]:
+                print("Stopping trial {} at {} with AvgReward {:.2f}, top {} need {:.2f}".format(
+                    tid, rung, trial["rungs"][key], keep, peers[keep - 1]))
+                self.stop(tid, "stopped")
+                return
+
+    def run(self):
+        interrupted = False
+        try:
+            while True:
+                for tid in list(self.processes):
+                    self.check_rungs(tid)
+                    if tid not in self.processes:
+                        continue
+                    returncode = self.processes[tid].poll()
+                    if returncode is not None:
+                        self.processes.pop(tid)
+                        self.state["trials"][tid]["status"] = "finished" if returncode == 0 else "failed"
+                        print("Trial {} {}".format(tid, self.state["trials"][tid]["status"]))
+
+                pending = [tid for tid, trial in self.state["trials"].items() if trial["status"] == "pending"]
+                while pending and len(self.processes) < self.parallel:
+                    self.launch(pending.pop(0))
+                self.save_state()
+
+                if not self.processes and not pending:
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            # never leave trials running without a scheduler, they are restarted on resume
+            for tid in list(self.processes):
+                interrupted = True
+                self.stop(tid, "pending")
+                self.state["trials"][tid]["rungs"] = {}
+            if interrupted:
+                try:
+                    self.save_state()
+                except (OSError, TypeError, ValueError) as e:
+                    print("Could not save sweep state: {}".format(e))
+        self.summary()
+
+    def summary(self):
+        trials = sorted(self.state["trials"].items(), key=lambda item: -np.inf if item[1]["score"] is None else item[1]["score"], reverse=True)
+        for tid, trial in trials:
+            score = "-" if trial["score"] is None else "{:.2f}".format(trial["score"])
+            changed = {k: v for k, v in trial["params"].items() if any(v != other["params"].get(k) for other in self.state["trials"].values())}
+            print("{} {:>8} AvgReward {:>8} {} {}".format(tid, trial["status"], score, trial["run_name"], changed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run a sweep of train() parameter sets with successive halving early stopping")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="run or resume a sweep")
+    run_parser.add_argument("spec", help="path to sweep spec json", type=str)
+    run_parser.add_argument('--sweep_dir', dest='sweep_dir', default=None, help="where sweep state and logs go, defaults to ./sweeps/<spec name>/", type=str)
+    run_parser.add_argument('--parallel', dest='parallel', default=None, help="trials run at once, defaults to what fits in cores and memory", type=int)
+    run_parser.add_argument('--threads_per_trial', dest='threads_per_trial', default=1, help="cores given to each trial", type=int)
+    run_parser.add_argument('--mem_per_trial_gb', dest='mem_per_trial_gb', default=2.0, help="memory each trial is expected to use", type=float)
+    run_parser.add_argument('--min_progress', dest='min_progress', default=250, help="episodes (iterations offline) before the first comparison", type=int)
+    run_parser.add_argument('--eta', dest='eta', default=3, help="keep the top 1/eta of trials at each rung", type=int)
+    run_parser.add_argument('--smooth', dest='smooth', default=5, help="number of AvgReward logs averaged into a score", type=int)
+    run_parser.add_argument('--poll_interval', dest='poll_interval', default=10.0, help="seconds between metric checks", type=float)
+    trial_parser = subparsers.add_parser("trial", help="run a single trial, used internally")
+    trial_parser.add_argument("params", help="json of train() keyword arguments", type=str)
+    args = parser.parse_args()
+
+    if args.command == "trial":
+        from train_dqn import train
+        train(**json.loads(args.params))
+        return
+    if args.command != "run":
+        parser.print_help()
+        return
+
+    if args.eta < 2:
+        print("eta must be at least 2, got {}".format(args.eta))
+        raise ValueError
+    if args.min_progress < 1:
+        print("min_progress must be at least 1, got {}".format(args.min_progress))
+        raise ValueError
+
+    sweep_dir = args.sweep_dir or os.path.join("./sweeps/", os.path.splitext(os.path.basename(args.spec))[0])
+    os.makedirs(sweep_dir, exist_ok=True)
+    parallel = args.parallel or default_parallel(args.threads_per_trial, args.mem_per_trial_gb)
+    print("Running up to {} trials at once".format(parallel))
+    Sweep(args.spec, sweep_dir, parallel, args.threads_per_trial, args.min_progress, args.eta, args.smooth, args.poll_interval).run()
+
+
+if __name__ == "__main__":
+    main()
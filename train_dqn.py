@@ -13,14 +13,20 @@ import datetime
 import qvalues
 import random
 import constants
+import data_parallel
+from checkpoint_store import CheckpointStore
+import replay_cache
+import cpu_tuning
+import functools
 
-def compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime=None):
+def compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime=None, steps=None):
     """
     param:
         s : (N, |S|)
         a : batch of of actions (N,)
-        r : batch of rewards (N,)
+        r : batch of rewards (N,), discounted sums of `steps` rewards for n-step transitions
         s_prime : (N, |S|)
+        steps : batch of number of rewards summed into r (N,), bootstraps with gamma^steps. None means 1
         q_
     return:
         a scalar value representing the loss
@@ -32,7 +38,10 @@ def compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime=None):
     else:
         bootstrap = dqn.forward_best_actions(s_prime)[1]
 
-    target = discount_factor * bootstrap
+    if steps is None:
+        target = discount_factor * bootstrap
+    else:
+        target = torch.pow(discount_factor, steps) * bootstrap
     done_mask = done  < 0.5
     target *= done_mask 
     target += r
@@ -58,35 +67,74 @@ def train(
     eval_episodes=16,
     gd_optimizer="RMSprop",
     num_episodes=50000,
-    decay = None
+    decay = None,
+    world_size=1,
+    rank=0,
+    intra_op_threads=None,
+    inter_op_threads=None,
+    cpu_cores=None,
+    loader_cores=None,
+    autotune_threads=False,
+    run_name=None,
+    n_step=1,
+    checkpoint_encoding="float32",
+    keep_last=None,
+    keep_best=None,
+    warm_start_episodes=0,
+    warm_start_seed=0,
+    replay_cache_dir="./replay_cache/"
 ):
     """
     param:
         learning_rate:
+        world_size: number of data-parallel learner processes, see data_parallel.launch
+        rank: index of this learner process, rank 0 steps the env, logs and saves models
+        intra_op_threads: size of the torch intra-op thread pool, None keeps the torch default
+        inter_op_threads: size of the torch inter-op thread pool, None keeps the torch default
+        cpu_cores: cores to pin rollout and learner work to, e.g. "0-3", split between ranks
+        loader_cores: cores to pin DataLoader workers to
+        autotune_threads: benchmark the training step to pick intra_op_threads
+        run_name: name of the run's models / meta_text / metrics / runs entries, defaults to the start time
+        n_step: number of rewards summed into each replay transition before bootstrapping
+        checkpoint_encoding: "float32", "float16" or "delta", see CheckpointStore
+        keep_last: keep only the last keep_last checkpoints, None keeps all
+        keep_best: also keep the keep_best checkpoints with the highest eval reward
+        warm_start_episodes: number of cached random-policy episodes the replay buffer starts with, 0 disables
+        warm_start_seed: seed of the cached episodes
+        replay_cache_dir: directory of the warm start cache, see replay_cache
         
     return:
         None
 
     """
     params = locals()
-    for param in params:
-        print(f"Using {param}={params[param]}")
+    if world_size > 1 and not online:
+        print("Data-parallel training is only supported online")
+        raise ValueError
 
-    ident_string = datetime.datetime.now().strftime("%Y_%m_%d_%H.%M.%S.%f")
+    if rank == 0:
+        for param in params:
+            print(f"Using {param}={params[param]}")
 
-    if not os.path.isdir("./models/"):
-        os.mkdir("./models/")
-    os.mkdir("./models/{}/".format(ident_string))
+    ident_string = run_name or datetime.datetime.now().strftime("%Y_%m_%d_%H.%M.%S.%f")
 
-    if not os.path.isdir("./meta_text/"):
-        os.mkdir("./meta_text/")
+    if rank == 0:
+        if not os.path.isdir("./models/"):
+            os.mkdir("./models/")
+        os.mkdir("./models/{}/".format(ident_string))
 
-    if not os.path.isdir("./metrics/"):
-        os.mkdir("./metrics/")
+        if not os.path.isdir("./meta_text/"):
+            os.mkdir("./meta_text/")
 
-    with open(f"./meta_text/{ident_string}.txt", "w+") as text_file:
-        for param in params:
-            text_file.write(f"{param}={params[param]}\n")
+        if not os.path.isdir("./metrics/"):
+            os.mkdir("./metrics/")
+
+        with open(f"./meta_text/{ident_string}.txt", "w+") as text_file:
+            for param in params:
+                text_file.write(f"{param}={params[param]}\n")
+
+    thread_config = cpu_tuning.configure(intra_op_threads, inter_op_threads, cpu_cores, rank, world_size)
+    worker_init_fn = functools.partial(cpu_tuning.pin_loader_worker, cpu_tuning.parse_cores(loader_cores))
  
     env = gym.make(env_name)
     if not isinstance(env.action_space, gym.spaces.discrete.Discrete):
@@ -95,7 +143,7 @@ def train(
 
     print("Using env: {}".format(env_name))
     action_space_dim = env.action_space.n
-    obs_space_dim = np.prod(env.observation_space.shape)
+    obs_space_dim = int(np.prod(env.observation_space.shape))
     print("Action space dimension: {}".format(action_space_dim))
     print("Observation space dimension {}".format(obs_space_dim))
 
@@ -113,6 +161,15 @@ def train(
             print("DQN Prime on GPU")
             dqn_prime = dqn_prime.cuda()
 
+    if world_size > 1:
+        # every rank starts from the weights of rank 0 and then samples its own slice of each batch
+        data_parallel.broadcast_parameters(dqn)
+        torch.manual_seed(torch.initial_seed() + rank)
+        if batch_size % world_size != 0:
+            print("batch_size {} is not divisible by world_size {}".format(batch_size, world_size))
+            raise ValueError
+        batch_size = batch_size // world_size
+
     if gd_optimizer == "Adam":
         optimizer = optim.Adam(dqn.parameters(), lr=learning_rate)
     elif gd_optimizer == "SGD":
@@ -123,23 +180,54 @@ def train(
         print("Invalid gd_optimizer: {}".format(gd_optimizer))
         raise ValueError
 
-    summary_writer = SummaryWriter(log_dir=f'./runs/{ident_string}')
+    if autotune_threads:
+        step_fn = benchmark_step(obs_space_dim, action_space_dim, batch_size, discount_factor)
+        candidates = cpu_tuning.candidate_thread_counts(thread_config["cpu_cores"])
+        thread_config["intra_op_threads"], thread_config["autotune_timings"] = cpu_tuning.autotune_intra_op_threads(step_fn, candidates)
+
+    if rank == 0:
+        print("Using thread config {}".format(thread_config))
+        with open(f"./meta_text/{ident_string}.txt", "a") as text_file:
+            for key in thread_config:
+                text_file.write(f"{key}={thread_config[key]}\n")
+
+    summary_writer = None
+    checkpoints = None
+    if rank == 0:
+        summary_writer = SummaryWriter(log_dir=f'./runs/{ident_string}')
+        checkpoints = CheckpointStore("./models/{}/".format(ident_string), checkpoint_encoding, keep_last, keep_best)
+    eval_reward = None
     
     # gradient step every time a transition is collected
     epsilon_use = epsilon
 
+    warm_start = None
+    if warm_start_episodes > 0:
+        # rank 0 fills the cache if it is missing, the other ranks wait and memory-map it
+        if rank == 0:
+            warm_start = replay_cache.load_or_collect(env_name, warm_start_episodes, warm_start_seed, replay_cache_dir)
+        if world_size > 1:
+            data_parallel.barrier()
+        if rank != 0:
+            warm_start = replay_cache.load_or_collect(env_name, warm_start_episodes, warm_start_seed, replay_cache_dir)
+
     if online:
         # initialize dataset
-        observation = env.reset()
-        action = env.action_space.sample()
-        observation_, reward, done, info = env.step(action)
-        terminal = 1 if done else 0
-        replay = [observation, action, reward, observation_, terminal]
-        dataset = TrajectoryDataset(replay, max_replay_history=max_replay_history)
+        replay = None
+        if rank == 0:
+            observation = env.reset()
+            action = env.action_space.sample()
+            observation_, reward, done, info = env.step(action)
+            terminal = 1 if done else 0
+            replay = [observation, action, reward, observation_, terminal]
+        if world_size > 1:
+            replay = data_parallel.broadcast_transition(replay, obs_space_dim)
+        dataset = TrajectoryDataset(replay if warm_start is None else warm_start, max_replay_history=max_replay_history, n_step=n_step, discount_factor=discount_factor)
         dataloader = torch.utils.data.DataLoader(dataset,
                                                  batch_size=batch_size,
                                                  num_workers=n_threads,
                                                  sampler=torch.utils.data.RandomSampler(dataset),
+                                                 worker_init_fn=worker_init_fn,
                                                  )
         dataset.add_transition(replay)
         dataset.flush()
@@ -148,72 +236,92 @@ def train(
 
         # go through episodes
         for i_episode in range(num_episodes):
-            if torch.cuda.is_available():
-                print("Episode {}, Transitions {}, MemAlloc {}".format(i_episode, len(dataset), torch.cuda.memory_allocated()))
-            else:
-                print("Episode {}, Transitions {}".format(i_episode, len(dataset)))
-            observation = env.reset()
+            if rank == 0:
+                if torch.cuda.is_available():
+                    print("Episode {}, Transitions {}, MemAlloc {}".format(i_episode, len(dataset), torch.cuda.memory_allocated()))
+                else:
+                    print("Episode {}, Transitions {}".format(i_episode, len(dataset)))
+                observation = env.reset()
             total_reward = 0
             if decay is not None:
                 epsilon_use = epsilon * np.power(decay, i_episode)
             if use_ddqn and i_episode % copy_params_every == 0:
-                print("Copying dqn to dqn_prime")
+                if rank == 0:
+                    print("Copying dqn to dqn_prime")
                 dqn_prime.load_state_dict(dqn.state_dict())
             while True:  # repeat
-                if render:
-                    env.render()
-                # selecting an action
-                if dqn and random.random() > epsilon_use:
-                    action = torch.squeeze(dqn.forward_best_actions([observation])[0]).item()
-                else:
-                    action = env.action_space.sample()  # random sample of action space
-                # carry out action, observe new reward and state
-                observation_, reward, done, info = env.step(action)
-                total_reward += reward
+                transition = None
+                if rank == 0:
+                    if render:
+                        env.render()
+                    # selecting an action
+                    if dqn and random.random() > epsilon_use:
+                        action = torch.squeeze(dqn.forward_best_actions([observation])[0]).item()
+                    else:
+                        action = env.action_space.sample()  # random sample of action space
+                    # carry out action, observe new reward and state
+                    observation_, reward, done, info = env.step(action)
+                    total_reward += reward
+                    terminal = 1 if done else 0
+                    transition = [observation, action, reward, observation_, terminal]
+                if world_size > 1:
+                    transition = data_parallel.broadcast_transition(transition, obs_space_dim)
+                terminal = transition[4]
                 # store experience in replay memory
-                terminal = 1 if done else 0
-                dataset.add_transition([observation, action, reward, observation_, terminal])
+                dataset.add_transition(transition)
                 # sample random transition from replay memory
                 sarsd = next(iter(dataloader))
-                s, a, r, s_prime, done = unpack_dataloader_sarsd(sarsd, obs_space_dim)
+                s, a, r, s_prime, done, steps = unpack_dataloader_sarsd(sarsd, obs_space_dim)
                 if torch.cuda.is_available():
                     s = s.cuda()
                     a = a.cuda()
                     r = r.cuda()
                     s_prime = s_prime.cuda()
                     done = done.cuda()
-                loss =  compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime)
+                    steps = steps.cuda()
+                loss =  compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime, steps)
                 optimizer.zero_grad()
                 loss.backward()
+                if world_size > 1:
+                    data_parallel.all_reduce_gradients(dqn, world_size)
                 optimizer.step()  # does the gradient update, loss computed update
                 # change current state
-                observation = observation_
+                if rank == 0:
+                    observation = observation_
                 if terminal:
                     break
             dataset.flush()
 
+            if rank != 0:
+                continue
+
             summary_writer.add_scalar("RealReward", total_reward, i_episode)
 
             # log evaluation metrics
             if i_episode % freq_report_log == 0:
                 undiscounted_avg_reward, q_difference, avg_q = log_evaluate(env, dqn, eval_episodes, summary_writer, i_episode)
+                eval_reward = undiscounted_avg_reward
                 metrics.append([i_episode, undiscounted_avg_reward, q_difference, avg_q.cpu(), total_reward])
                 np.save("./metrics/" + ident_string + ".npy", np.array(metrics))
             
             if i_episode % save_model_every == 0:
-                torch.save(dqn, "./models/{}/dqn_{}.pt".format(ident_string, i_episode))
+                checkpoints.save(i_episode, dqn, eval_reward)
 
         
         env.close()
+        if checkpoints is not None:
+            checkpoints.close()
         return
 
     # collect trajectories with random policy
-    init_trajectories = collect_trajectories(env, episodes_per_iteration, sarsa=False, dqn=dqn)
-    dataset = TrajectoryDataset(init_trajectories, max_replay_history=max_replay_history, online=False)
+    if warm_start is None:
+        warm_start = collect_trajectories(env, episodes_per_iteration, sarsa=False, dqn=dqn)
+    dataset = TrajectoryDataset(warm_start, max_replay_history=max_replay_history, online=False, n_step=n_step, discount_factor=discount_factor)
     dataloader = torch.utils.data.DataLoader(dataset,
         batch_size=batch_size,
         num_workers=n_threads,
         sampler=torch.utils.data.RandomSampler(dataset),
+        worker_init_fn=worker_init_fn,
         )
 
     metrics = []
@@ -229,7 +337,7 @@ def train(
         # fitted Q-iteration
 
         sarsd = next(iter(dataloader))
-        s, a, r, s_prime, done = unpack_dataloader_sarsd(sarsd, obs_space_dim)
+        s, a, r, s_prime, done, steps = unpack_dataloader_sarsd(sarsd, obs_space_dim)
 
         if torch.cuda.is_available():
             s = s.cuda()
@@ -237,8 +345,9 @@ def train(
             r = r.cuda()
             s_prime = s_prime.cuda()
             done = done.cuda()
+            steps = steps.cuda()
 
-        loss = compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime)
+        loss = compute_loss(s, a, r, s_prime, done, dqn, discount_factor, dqn_prime, steps)
         optimizer.zero_grad()
         loss.backward()
         optimizer.step()
@@ -252,13 +361,43 @@ def train(
         # log evaluation metrics
         if i % freq_report_log == 0:
             undiscounted_avg_reward, q_difference, avg_q = log_evaluate(env, dqn, eval_episodes, summary_writer, i)
+            eval_reward = undiscounted_avg_reward
             metrics.append([i, undiscounted_avg_reward, q_difference, avg_q])
             np.save("./metrics/" + ident_string + ".npy", np.array(metrics))
 
         if i% save_model_every == 0:
-            torch.save(dqn, "./models/{}/dqn_{}.pt".format(ident_string, i))
+            checkpoints.save(i, dqn, eval_reward)
 
     env.close()
+    checkpoints.close()
+
+def benchmark_step(obs_space_dim, action_space_dim, batch_size, discount_factor):
+    """
+    param:
+        obs_space_dim: int representing dimension of state vector
+        action_space_dim: int representing number of possible actions
+        batch_size: batch size of each gradient update
+        discount_factor: gamma used in the loss
+    return:
+        function running one training step of a scratch DQN on a random batch
+    """
+    dqn = DQN(obs_space_dim, action_space_dim)
+    optimizer = optim.Adam(dqn.parameters())
+    s = torch.randn(batch_size, obs_space_dim)
+    a = torch.randint(action_space_dim, (batch_size,))
+    r = torch.randn(batch_size)
+    s_prime = torch.randn(batch_size, obs_space_dim)
+    done = torch.zeros(batch_size)
+    if torch.cuda.is_available():
+        s, a, r, s_prime, done = s.cuda(), a.cuda(), r.cuda(), s_prime.cuda(), done.cuda()
+
+    def step():
+        loss = compute_loss(s, a, r, s_prime, done, dqn, discount_factor)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    return step
 
 def unpack_dataloader_sarsd(sarsd, obs_space_dim):
     N = len(sarsd)
@@ -277,7 +416,10 @@ def unpack_dataloader_sarsd(sarsd, obs_space_dim):
     done = sarsd[:, obs_space_dim + 1 + 1 + obs_space_dim: obs_space_dim + 1 + 1 + obs_space_dim + 1]
     done = torch.reshape(done, (N,))
 
-    return s, a, r, s_prime, done
+    steps = sarsd[:, obs_space_dim + 1 + 1 + obs_space_dim + 1: obs_space_dim + 1 + 1 + obs_space_dim + 1 + 1]
+    steps = torch.reshape(steps, (N,))
+
+    return s, a, r, s_prime, done, steps
 
 
 def log_evaluate(env, dqn, num_episodes, summary_writer, iteration):
@@ -9,25 +9,40 @@ from collections.abc import Iterable
 
 
 class TrajectoryDataset(Dataset):
-    def __init__(self, init, max_replay_history, online = True):
+    def __init__(self, init, max_replay_history, online = True, n_step=1, discount_factor=0.99):
         """
             param:
                 trajectories: list of trajectories. assumes each trajectory is a list of sarsa tuples 
+                    or an array of 1-step rows in episode order, see add_array
                 max_replay_history: int indicating the max number of transitions (sarsa tuples) to store
+                n_step: number of rewards summed into each stored transition
+                discount_factor: gamma used to discount the summed rewards
+
+            each stored transition is [s, a, r, s_prime, done, steps] where r is the discounted sum of the
+            rewards of the next `steps` transitions, s_prime the state reached after them and done whether
+            the episode ended on the way. steps is n_step except at the end of an episode.
         """
         # self.transitions = np.array([transition for trajectory in trajectories for transition in trajectory], dtype=float)
+        # ring of max_replay_history rows, allocated on the first write once the row width is known,
+        # rows [0, size) are filled and transition_index is the next row to write
         if torch.cuda.is_available():
             self.transitions = torch.Tensor().cuda()
         else:
             self.transitions = torch.Tensor()
+        self.size = 0
 
         self.trajectories = []
         self.buffer = []
         self.original_trajectories = []
         self.max_replay_history = max_replay_history
         self.transition_index = 0
+        self.n_step = n_step
+        self.discount_factor = discount_factor
+        self.pending = []
 
-        if online:
+        if isinstance(init, np.ndarray):
+            self.add_array(init)
+        elif online:
             self.add_transition(init)
             self.flush()
         else:
@@ -40,7 +55,7 @@ class TrajectoryDataset(Dataset):
                 number of transitions
 
         """
-        return len(self.transitions)
+        return self.size
 
     def __getitem__(self, idx):
         """
@@ -57,37 +72,45 @@ class TrajectoryDataset(Dataset):
                 trajectories: list of trajectories. assumes each trajectory is a list of sarsa tuples 
             return:
         """
-        dim = sum([len(i) if isinstance(i, Iterable) else 1 for i in trajectories[0][0]])
+        dim = sum([len(i) if isinstance(i, Iterable) else 1 for i in trajectories[0][0]]) + 1
         new_transitions = torch.zeros([sum([len(traj) for traj in trajectories]), dim], dtype=torch.float64)
         if torch.cuda.is_available():
             new_transitions = new_transitions.cuda()
 
         idx = 0
         for trajectory in trajectories:
+            pending = []
+            rows = []
             for transition in trajectory:
-                s = transition[0]
-                a = transition[1]
-                r = transition[2]
-                s_prime = transition[3]
-                done = transition[4]
-                
-                if torch.cuda.is_available():
-                    trans_tensor = torch.Tensor([*s,a,r,*s_prime,done]).cuda()
-                else:
-                    trans_tensor = torch.Tensor([*s,a,r,*s_prime,done])
-
-                new_transitions[idx] = trans_tensor
+                rows += self.accumulate(pending, transition)
+            for row in rows + pending:
+                new_transitions[idx] = self.row_tensor(row)
                 idx+=1
 
-        if len(new_transitions) >= self.max_replay_history:
-            self.transitions = new_transitions[len(new_transitions.float()) - self.max_replay_history:].float()
-        elif len(new_transitions) + len(self.transitions) >= self.max_replay_history:
-            old_start_index = (len(self.transitions.float()) + len(new_transitions.float())) - self.max_replay_history
-            self.transitions = torch.cat((self.transitions[old_start_index:].float(),new_transitions.float()))
-        else:
-            self.transitions = torch.cat((self.transitions.float(), new_transitions.float()))
+        self.write_rows(new_transitions)
         self.add_trajectories(trajectories)
 
+    def add_array(self, transitions):
+        """
+            param:
+                transitions: float32 array of 1-step rows [*s, a, r, *s_prime, done, 1] in episode order,
+                    e.g. a memory-mapped replay cache. the last max_replay_history rows are copied into the
+                    ring once, so only the pages of the map that are used are ever read
+            return:
+        """
+        if self.n_step == 1:
+            rows = transitions[max(0, len(transitions) - self.max_replay_history):]
+        else:
+            obs_dim = (transitions.shape[1] - 4) // 2
+            pending = []
+            finished = []
+            for row in transitions:
+                finished += self.accumulate(pending, [row[:obs_dim], row[obs_dim], row[obs_dim + 1], row[obs_dim + 2: 2 * obs_dim + 2], row[2 * obs_dim + 2]])
+            finished += pending
+            rows = np.array([[*s, a, r, *s_prime, done, steps] for s, a, r, s_prime, done, steps in finished[-self.max_replay_history:]], dtype=np.float32)
+
+        self.write_rows(torch.from_numpy(np.asarray(rows)))
+
     def add_trajectories(self, trajectories):
         """
             param:
@@ -136,29 +159,78 @@ class TrajectoryDataset(Dataset):
                 trans: transition to be added to transitions
         """
         self.buffer.append(transition)
+        for row in self.accumulate(self.pending, transition):
+            self.write_row(row)
+
+    def accumulate(self, pending, transition):
+        """
+            param:
+                pending: list of rows [s, a, r, s_prime, done, steps] of the current episode still
+                    collecting rewards, updated in place
+                transition: next [s, a, r, s_prime, done] of the episode
+            return:
+                list of rows that have collected n_step rewards or reached the end of the episode
+        """
         s = transition[0]
         a = transition[1]
         r = transition[2]
         s_prime = transition[3]
         done = transition[4]
-        
+
+        for row in pending:
+            row[2] += (self.discount_factor ** row[5]) * r
+            row[3] = s_prime
+            row[4] = done
+            row[5] += 1
+        pending.append([s, a, r, s_prime, done, 1])
+
+        finished = []
+        while pending and (done or pending[0][5] >= self.n_step):
+            finished.append(pending.pop(0))
+        return finished
+
+    def row_tensor(self, row):
+        s, a, r, s_prime, done, steps = row
         if torch.cuda.is_available():
-            trans_tensor = torch.Tensor([*s,a,r,*s_prime,done]).cuda()
-        else:
-            trans_tensor = torch.Tensor([*s,a,r,*s_prime,done])    
+            return torch.Tensor([*s,a,r,*s_prime,done,steps]).cuda()
+        return torch.Tensor([*s,a,r,*s_prime,done,steps])
 
-        if self.transitions.size() == torch.Size([0]):
-            self.transitions = trans_tensor.reshape([1,len(trans_tensor)])
-        elif len(self.transitions) == self.max_replay_history:
-            self.transitions[self.transition_index] = trans_tensor.reshape([1,len(trans_tensor)])
-        else:
-            self.transitions = torch.cat((self.transitions, trans_tensor.reshape([1,len(trans_tensor)])))
-        self.transition_index += 1 
-        self.transition_index = self.transition_index % self.max_replay_history
-        
+    def write_row(self, row):
+        """
+            param:
+                row: [s, a, r, s_prime, done, steps] written to the ring of transitions
+        """
+        trans_tensor = self.row_tensor(row)
+        self.write_rows(trans_tensor.reshape([1,len(trans_tensor)]))
+
+    def write_rows(self, rows):
+        """
+            param:
+                rows: tensor of rows [*s, a, r, *s_prime, done, steps] written in place to the ring of
+                    transitions, oldest rows are overwritten once it is full
+        """
+        n = len(rows)
+        if n == 0:
+            return
+        if len(self.transitions) == 0:
+            self.transitions = torch.zeros([self.max_replay_history, rows.shape[1]], device=self.transitions.device)
+
+        # only the newest max_replay_history rows survive the write
+        rows = rows[max(0, n - self.max_replay_history):]
+        start = (self.transition_index + n - len(rows)) % self.max_replay_history
+        positions = (start + torch.arange(len(rows))) % self.max_replay_history
+        self.transitions[positions.to(self.transitions.device)] = rows.to(self.transitions.device, torch.float32)
+        self.transition_index = (self.transition_index + n) % self.max_replay_history
+        self.size = min(self.size + n, self.max_replay_history)
 
     def flush(self):
+        """
+            ends the current episode, transitions still collecting rewards are stored with fewer than n_step steps
+        """
         # self.add_trajectories([self.buffer])
+        for row in self.pending:
+            self.write_row(row)
+        self.pending = []
         self.buffer = []
 
 #         Traceback (most recent call last):
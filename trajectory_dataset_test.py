@@ -0,0 +1,81 @@
+import numpy as np
+import torch
+from trajectory_dataset import TrajectoryDataset
+
+# checks the n-step rows of TrajectoryDataset on a short known episode:
+#   python trajectory_dataset_test.py
+
+N_STEP = 3
+GAMMA = 0.5
+
+# states s_i = [i], actions 10 + i, rewards 1, 2, 3, 4, the last transition ends the episode
+EPISODE = [[[float(i)], 10 + i, float(i + 1), [float(i + 1)], 1 if i == 3 else 0] for i in range(4)]
+
+# [s, a, r, s_prime, done, steps]
+EXPECTED = [
+    [0, 10, 1 + GAMMA * 2 + GAMMA ** 2 * 3, 3, 0, 3],
+    [1, 11, 2 + GAMMA * 3 + GAMMA ** 2 * 4, 4, 1, 3],
+    [2, 12, 3 + GAMMA * 4, 4, 1, 2],
+    [3, 13, 4, 4, 1, 1],
+]
+
+DUMMY = [[-1.0], 0, 0.0, [-1.0], 1]
+DUMMY_ROW = [-1, 0, 0, -1, 1, 1]
+
+
+def stored_rows(dataset):
+    rows = torch.stack([dataset[i] for i in range(len(dataset))]).cpu().float()
+    return rows[torch.argsort(rows[:, 0])]
+
+
+def assert_rows(dataset, expected, name):
+    rows = stored_rows(dataset)
+    expected = torch.tensor(expected, dtype=torch.float32)
+    assert rows.shape == expected.shape, "{}: stored {} rows, expected {}".format(name, len(rows), len(expected))
+    assert torch.allclose(rows, expected), "{}:\n{}\nexpected\n{}".format(name, rows, expected)
+
+
+def online_dataset(transitions, max_replay_history):
+    dataset = TrajectoryDataset(DUMMY, max_replay_history=max_replay_history, n_step=N_STEP, discount_factor=GAMMA)
+    for transition in transitions:
+        dataset.add_transition(transition)
+    dataset.flush()
+    return dataset
+
+
+def episode_array():
+    return np.array([[*s, a, r, *s_prime, done, 1] for s, a, r, s_prime, done in EPISODE], dtype=np.float32)
+
+
+def main():
+    dataset = TrajectoryDataset([EPISODE], max_replay_history=100, online=False, n_step=N_STEP, discount_factor=GAMMA)
+    assert_rows(dataset, EXPECTED, "add")
+
+    assert_rows(online_dataset(EPISODE, 100), [DUMMY_ROW] + EXPECTED, "add_transition")
+
+    # episode cut off before it ends: flush stores the pending tail with fewer steps
+    unfinished = [[[0.0], 10, 1.0, [1.0], 0], [[1.0], 11, 2.0, [2.0], 0]]
+    assert_rows(online_dataset(unfinished, 100), [DUMMY_ROW, [0, 10, 1 + GAMMA * 2, 2, 0, 2], [1, 11, 2, 2, 0, 1]], "flush")
+
+    # ring smaller than the episode: only the newest rows are kept, the dummy is overwritten
+    dataset = online_dataset(EPISODE, 3)
+    assert len(dataset) == 3
+    assert_rows(dataset, EXPECTED[1:], "add_transition wraparound")
+    # keep writing after wrapping around
+    dataset.add_transition([[5.0], 15, 6.0, [6.0], 1])
+    assert_rows(dataset, EXPECTED[2:] + [[5, 15, 6, 6, 1, 1]], "add_transition second wraparound")
+
+    dataset = TrajectoryDataset([EPISODE], max_replay_history=3, online=False, n_step=N_STEP, discount_factor=GAMMA)
+    assert_rows(dataset, EXPECTED[1:], "add wraparound")
+
+    dataset = TrajectoryDataset(episode_array(), max_replay_history=100, n_step=N_STEP, discount_factor=GAMMA)
+    assert_rows(dataset, EXPECTED, "add_array")
+
+    dataset = TrajectoryDataset(episode_array(), max_replay_history=3, n_step=N_STEP, discount_factor=GAMMA)
+    assert_rows(dataset, EXPECTED[1:], "add_array wraparound")
+
+    print("n-step rows ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # code to visualize
 from dqn import DQN
-from torch import load
+from compact_policy import load_policy
 from run import collect_trajectories 
 import argparse
 import gym
@@ -8,13 +8,14 @@ import gym
 
 def main():
     parser = argparse.ArgumentParser(description="to visualize trained model")
-    parser.add_argument("model_name", help="path to model to visualize", type=str)
+    parser.add_argument("model_name", help="path to model or run directory to visualize, or a .npz / .int8.pt export of compact_policy.py", type=str)
+    parser.add_argument("--episode", dest="episode", default=None, help="episode to load from a run directory, defaults to the latest", type=int)
     # parser.add_argument("state_dim", help="number of state dimensions", type=int)
     # parser.add_argument("obs_dim", help="number of observations dimensions", type=int)
     args = parser.parse_args()
 
     # dqn = DQN(args.state_dim, args.obs_dim)
-    model = load(args.model_name)
+    model = load_policy(args.model_name, args.episode)
     collect_trajectories(gym.make("LunarLander-v2"), dqn=model, episodes=100, render=True)
 
 